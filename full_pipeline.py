@@ -3,8 +3,8 @@ import os
 import sys
 import argparse
 import numpy as np
-import re
 import time
+from PIL import Image, ImageDraw
 
 sys.path.insert(
     0,
@@ -15,36 +15,44 @@ sys.path.insert(
             '../../')))
 
 from module.ocr import OCR 
-from module import LayoutRecognizer, TableStructureRecognizer, init_in_out
+from module import LayoutRecognizer, TableStructureRecognizer, iter_in_out
 
 from datetime import datetime
 
-log_dir = "log"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "full_pipeline.log")
 
-# Count previous runs by counting lines that start with "=== Run"
-run_count = 1
-if os.path.exists(log_file):    
-    with open(log_file, "r", encoding="utf-8") as f:
-        run_count += sum(1 for line in f if line.startswith("=== Run"))
+def init_log():
+    """Append a run header to the log file and redirect stdout/stderr into it.
 
-# Write run header with count and date
-with open(log_file, "a", encoding="utf-8") as f:
-    f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+    Called from __main__ only, so importing this script has no side effects.
+    """
+    log_dir = "log"
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, "full_pipeline.log")
 
-sys.stdout = open(log_file, "a", encoding="utf-8")
-sys.stderr = sys.stdout
+    # Count previous runs by counting lines that start with "=== Run"
+    run_count = 1
+    if os.path.exists(log_file):    
+        with open(log_file, "r", encoding="utf-8") as f:
+            run_count += sum(1 for line in f if line.startswith("=== Run"))
 
-def extract_table_markdown(img, table_region, ocr):
+    # Write run header with count and date
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+
+    sys.stdout = open(log_file, "a", encoding="utf-8")
+    sys.stderr = sys.stdout
+
+
+def extract_table_markdown(page, table_region, ocr, table_recognizer):
     # Use bbox if present
     if "bbox" in table_region:
         x0, y0, x1, y1 = map(int, table_region["bbox"])
     else:
         x0, y0, x1, y1 = map(int, [table_region["x0"], table_region["top"], table_region["x1"], table_region["bottom"]])
-    table_img = img.crop((x0, y0, x1, y1))
-    tb_cpns = TableStructureRecognizer()([table_img])[0]
-    boxes = ocr(np.array(table_img))
+    # A view into the page array
+    table_img = page[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)]
+    tb_cpns = table_recognizer([table_img])[0]
+    boxes = ocr(table_img)
     boxes = LayoutRecognizer.sort_Y_firstly(
         [{"x0": b[0][0], "x1": b[1][0],
           "top": b[0][1], "text": t[0],
@@ -54,18 +62,20 @@ def extract_table_markdown(img, table_region, ocr):
         np.mean([b[-1][1] - b[0][1] for b, _ in boxes]) / 3
     )
 
-    def gather(kwd, fzy=10, ption=0.6):
+    # TSR labels are a fixed vocabulary (TableStructureRecognizer.labels), so
+    # plain string tests select them without going through the regex engine
+    def gather(keep, fzy=10, ption=0.6):
         nonlocal boxes
         eles = LayoutRecognizer.sort_Y_firstly(
-            [r for r in tb_cpns if re.match(kwd, r["label"])], fzy)
+            [r for r in tb_cpns if keep(r["label"])], fzy)
         eles = LayoutRecognizer.layouts_cleanup(boxes, eles, 5, ption)
         return LayoutRecognizer.sort_Y_firstly(eles, 0)
 
-    headers = gather(r".*header$")
-    rows = gather(r".* (row|header)")
-    spans = gather(r".*spanning")
-    clmns = sorted([r for r in tb_cpns if re.match(
-        r"table column$", r["label"])], key=lambda x: x["x0"])
+    headers = gather(lambda lb: lb.endswith("header"))
+    rows = gather(lambda lb: " row" in lb or " header" in lb)
+    spans = gather(lambda lb: "spanning" in lb)
+    clmns = sorted([r for r in tb_cpns if r["label"] == "table column"],
+                   key=lambda x: x["x0"])
     clmns = LayoutRecognizer.layouts_cleanup(boxes, clmns, 5, 0.5)
 
     for b in boxes:
@@ -101,22 +111,23 @@ def extract_table_markdown(img, table_region, ocr):
     return markdown
 
 def main(args):
-    images, outputs = init_in_out(args)
-    print(f"Loaded {len(images)} images")
-    print(f"Output paths: {outputs}")
     layout_recognizer = LayoutRecognizer("layout")
+    # Built once per run and reused for every table
+    table_recognizer = TableStructureRecognizer()
     ocr = OCR()
-    for idx, img in enumerate(images):
-        print(f"Processing image {idx}: {outputs[idx]}")
+    threshold = float(args.threshold)
+    # Pages are rendered lazily, so only the page being processed is held in memory
+    for idx, (img, output) in enumerate(iter_in_out(args)):
+        print(f"Processing image {idx}: {output}")
         start_time = time.time()  # <-- Start timing
 
-        layouts = layout_recognizer.forward([img], thr=float(args.threshold))[0]
+        # Convert the page once; layout, table and text OCR all work on views of it
+        page = np.asarray(img)
+        layouts = layout_recognizer.forward([page], thr=threshold)[0]
         print(f"Detected {len(layouts)} layout regions")
         region_and_pos = []
 
-        from PIL import Image, ImageDraw
-
-        # Create a mask for detected regions
+        # One pass over the layout regions: mask covered areas and extract tables
         mask = Image.new("1", img.size, 0)
         draw = ImageDraw.Draw(mask)
         for region in layouts:
@@ -126,29 +137,27 @@ def main(args):
                 x0, y0, x1, y1 = map(int, [region.get("x0", 0), region.get("top", 0), region.get("x1", 0), region.get("bottom", 0)])
             draw.rectangle([x0, y0, x1, y1], fill=1)
 
-        for region in layouts:
             label = region.get("type", "").lower()
             score = region.get("score", 1.0)
             bbox = region.get("bbox", [region.get("x0", 0), region.get("top", 0), region.get("x1", 0), region.get("bottom", 0)])
             y_pos = bbox[1]  # Use top y as position for ordering
-            if label in ["table"] and score >= float(args.threshold):
+            if label in ["table"] and score >= threshold:
                 print(f"Extracting table markdown for region: {region}")
-                markdown = extract_table_markdown(img, region, ocr)
+                markdown = extract_table_markdown(page, region, ocr, table_recognizer)
                 region_and_pos.append((y_pos, markdown))
 
         # Now OCR any remaining undetected area (including non-table/figure)
         inv_mask = mask.point(lambda p: 1 - p)
         if inv_mask.getbbox():
             x0, y0, x1, y1 = inv_mask.getbbox()
-            region_img = img.crop((x0, y0, x1, y1))
-            ocr_results = ocr(np.array(region_img))
+            ocr_results = ocr(page[y0:y1, x0:x1])
             text = "\n".join([t[0] for _, t in ocr_results if t and t[0]])
             region_and_pos.append((y0, text))
 
         # Sort by y position to preserve original order
         region_and_pos.sort(key=lambda x: x[0])
         markdown_concat = "\n\n".join([item[1] for item in region_and_pos])
-        out_path = outputs[idx] + "_full.md"
+        out_path = output + "_full.md"
         print(f"Writing concatenated markdown to: {out_path}")
         with open(out_path, "w+", encoding='utf-8') as f:
             f.write(markdown_concat)
@@ -168,4 +177,5 @@ if __name__ == "__main__":
                         help="Detection threshold. Default: 0.5",
                         default=0.5)
     args = parser.parse_args()
+    init_log()
     main(args)
\ No newline at end of file
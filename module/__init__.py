@@ -14,10 +14,12 @@
 #  limitations under the License.
 #
 import io
+import statistics
 import sys
 import threading
 
-import pdfplumber
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 
 
 from .ocr import OCR
@@ -31,51 +33,107 @@ if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
 
-def init_in_out(args):
+def iter_in_out(args):
+    """
+    Lazily yield (image, output_path) for every input image / PDF page.
+
+    Pages are rasterized one at a time, so a consumer can start on the first
+    page while the rest of the document is still being rendered.
+    """
     from PIL import Image
     import os
     import traceback
     from utils.file_utils import traversal_files
-    images = []
-    outputs = []
 
     if not os.path.exists(args.output_dir):
         os.mkdir(args.output_dir)
 
+    def page_zoomin(page, zoomin, line_height=24, min_side=960, sample=200):
+        # Scale so body text lines are ~line_height px, never below the detector's
+        # 960 px side; scans and sparse text layers keep zoomin
+        width, height = page.get_size()
+        page_area = width * height
+        for obj in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]):
+            left, bottom, right, top = obj.get_bounds()
+            if (right - left) * (top - bottom) >= page_area / 2:
+                return zoomin
+        textpage = page.get_textpage()
+        try:
+            char_count = textpage.count_chars()
+            sampled = range(0, char_count, max(1, char_count // sample))
+            heights = []
+            ink_area = 0
+            for i in sampled:
+                left, bottom, right, top = textpage.get_charbox(i)
+                if top <= bottom:
+                    continue
+                ink_area += (right - left) * (top - bottom)
+                # The loose box spans the font's ascent..descent, i.e. the line
+                left, bottom, right, top = textpage.get_charbox(i, loose=True)
+                heights.append(top - bottom)
+        finally:
+            textpage.close()
+        # Page numbers or watermarks alone say nothing about the body text
+        if not heights or ink_area * char_count / len(sampled) < page_area * 0.05:
+            return zoomin
+        scale = line_height / statistics.median(heights)
+        return min(zoomin, max(1, min_side / max(width, height), scale))
+
     def pdf_pages(fnm, zoomin=3):
-        nonlocal outputs, images
+        # Render straight through pdfium, the renderer behind pdfplumber's to_image()
         with sys.modules[LOCK_KEY_pdfplumber]:
-            pdf = pdfplumber.open(fnm)
-            images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                enumerate(pdf.pages)]
-
-        for i, page in enumerate(images):
-            outputs.append(os.path.split(fnm)[-1] + f"_{i}.jpg")
-        pdf.close()
+            pdf = pdfium.PdfDocument(fnm)
+            page_count = len(pdf)
+        try:
+            for i in range(page_count):
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    page = pdf[i]
+                    try:
+                        image = page.render(scale=page_zoomin(page, zoomin)).to_pil()
+                    finally:
+                        page.close()
+                yield image, os.path.split(fnm)[-1] + f"_{i}.jpg"
+        finally:
+            # May run on another thread (or from GC of an abandoned generator)
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                pdf.close()
 
     def images_and_outputs(fnm):
-        nonlocal outputs, images
         if fnm.split(".")[-1].lower() == "pdf":
-            pdf_pages(fnm)
+            yield from pdf_pages(fnm)
             return
         try:
             fp = open(fnm, 'rb')
             binary = fp.read()
             fp.close()
-            images.append(Image.open(io.BytesIO(binary)).convert('RGB'))
-            outputs.append(os.path.split(fnm)[-1])
+            image = Image.open(io.BytesIO(binary))
+            # Decode here so a corrupt file is reported and skipped
+            image.load()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
         except Exception:
             traceback.print_exc()
+            return
+        yield image, os.path.split(fnm)[-1]
 
     if os.path.isdir(args.inputs):
-        for fnm in traversal_files(args.inputs):
-            images_and_outputs(fnm)
+        # List the inputs up front: outputs are written while pages are still
+        # being yielded, and an output_dir inside inputs must not be walked
+        fnms = list(traversal_files(args.inputs))
     else:
-        images_and_outputs(args.inputs)
+        fnms = [args.inputs]
+
+    for fnm in fnms:
+        for image, output in images_and_outputs(fnm):
+            yield image, os.path.join(args.output_dir, output)
 
-    for i in range(len(outputs)):
-        outputs[i] = os.path.join(args.output_dir, outputs[i])
 
+def init_in_out(args):
+    images = []
+    outputs = []
+    for image, output in iter_in_out(args):
+        images.append(image)
+        outputs.append(output)
     return images, outputs
 
 
@@ -85,4 +143,5 @@ __all__ = [
     "LayoutRecognizer",
     "TableStructureRecognizer",
     "init_in_out",
+    "iter_in_out",
 ]
@@ -28,6 +28,14 @@ from module import Recognizer
 from .operators import nms
 
 
+# Compiled once at import: checked against every OCR box on every page
+GARBAGE_PATTERNS = [re.compile(p) for p in [
+    r"^•+$", "^[0-9]{1,2} / ?[0-9]{1,2}$",
+    r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}",
+    "\\(cid *: *[0-9]+ *\\)"
+]]
+
+
 class LayoutRecognizer(Recognizer):
     labels = [
         "_background_",
@@ -63,11 +71,7 @@ class LayoutRecognizer(Recognizer):
 
     def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True):
         def __is_garbage(b):
-            patt = [r"^•+$", "^[0-9]{1,2} / ?[0-9]{1,2}$",
-                    r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}",
-                    "\\(cid *: *[0-9]+ *\\)"
-                    ]
-            return any([re.search(p, b["text"]) for p in patt])
+            return any(p.search(b["text"]) for p in GARBAGE_PATTERNS)
 
         if self.client:
             layouts = self.client.predict(image_list)
@@ -202,16 +206,17 @@ class LayoutRecognizer4YOLOv10(LayoutRecognizer):
             dw /= 2  # divide padding into 2 sides
             dh /= 2
             ww, hh = new_unpad
-            img = np.array(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)).astype(np.float32)
+            # Resize, colour conversion and padding all stay in uint8; the tensor
+            # is cast to float32 once, directly into its final NCHW layout
             img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             top, bottom = int(round(dh - 0.1)) if self.center else 0, int(round(dh + 0.1))
             left, right = int(round(dw - 0.1)) if self.center else 0, int(round(dw + 0.1))
             img = cv2.copyMakeBorder(
                 img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114)
             )  # add border
+            img = np.ascontiguousarray(img.transpose(2, 0, 1)[np.newaxis, :, :, :], dtype=np.float32)
             img /= 255.0
-            img = img.transpose(2, 0, 1)
-            img = img[np.newaxis, :, :, :].astype(np.float32)
             inputs.append({self.input_names[0]: img, "scale_factor": [shape[1]/ww, shape[0]/hh, dw, dh]})
 
         return inputs
@@ -15,7 +15,6 @@
 #
 
 import logging
-import copy
 import time
 import os
 
@@ -38,8 +37,10 @@ from .postprocess import build_post_process
 
 from vietocr.tool.predictor import Predictor
 from vietocr.tool.config import Cfg
+from vietocr.tool.utils import download_weights
 
 loaded_models = {}
+loaded_predictors = {}
 
 def transform(data, ops=None):
     """ transform """
@@ -74,8 +75,34 @@ def create_operators(op_param_list, global_config=None):
     return ops
 
 
-def load_model(model_dir, nm, device_id: int | None = None):
+def quantize_model(model_dir, nm):
+    """
+    Write an 8-bit copy of `nm`.onnx next to it as `nm`.int8.onnx
+    (dynamic quantization: uint8 weights, activations quantized at runtime).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
     model_file_path = os.path.join(model_dir, nm + ".onnx")
+    int8_file_path = os.path.join(model_dir, nm + ".int8.onnx")
+    # QUInt8 rather than QInt8: the detector and layout/TSR models are mostly
+    # convolutions, and ORT's CPU ConvInteger kernel only accepts uint8 weights
+    quantize_dynamic(model_file_path, int8_file_path, weight_type=QuantType.QUInt8)
+    logging.info(f"quantize_model {model_file_path} -> {int8_file_path}")
+    return int8_file_path
+
+
+def resolve_model_file(model_dir, nm):
+    model_file_path = os.path.join(model_dir, nm + ".onnx")
+    # Opt-in: prefer the int8 model produced by quantize_model when it exists
+    if os.environ.get("OCR_INT8_MODELS", "").lower() in ("1", "true"):
+        int8_file_path = os.path.join(model_dir, nm + ".int8.onnx")
+        if os.path.exists(int8_file_path):
+            model_file_path = int8_file_path
+    return model_file_path
+
+
+def load_model(model_dir, nm, device_id: int | None = None):
+    model_file_path = resolve_model_file(model_dir, nm)
     model_cached_tag = model_file_path + str(device_id) if device_id is not None else model_file_path
 
     global loaded_models
@@ -100,8 +127,10 @@ def load_model(model_dir, nm, device_id: int | None = None):
     options = ort.SessionOptions()
     options.enable_cpu_mem_arena = False
     options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
+    # Size ORT's thread pools to the deployment: e.g. one worker per core with
+    # OCR_INTRA_OP_NUM_THREADS=1, or one worker using every core
+    options.intra_op_num_threads = int(os.environ.get("OCR_INTRA_OP_NUM_THREADS", "2"))
+    options.inter_op_num_threads = int(os.environ.get("OCR_INTER_OP_NUM_THREADS", "2"))
 
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
     # Shrink GPU memory after execution
@@ -131,26 +160,55 @@ def load_model(model_dir, nm, device_id: int | None = None):
     loaded_models[model_cached_tag] = loaded_model
     return loaded_model
 
-class TextRecognizer:
-    """High-level wrapper around VietOCR for text recognition only."""
 
-    def __init__(self, model_dir=None, device_id: int | None = None):
-        # seq2seq config from vietocr (uses built-in weights download)
-        config = Cfg.load_config_from_name('vgg_seq2seq')
+def load_predictor(config_name="vgg_seq2seq", device_id: int | None = None):
+    # Keyed by config and device, so different recognizers stay loaded side by side
+    predictor_cached_tag = config_name + str(device_id) if device_id is not None else config_name
+
+    global loaded_predictors
+    loaded_predictor = loaded_predictors.get(predictor_cached_tag)
+    if loaded_predictor:
+        logging.info(f"load_predictor {predictor_cached_tag} reuses cached predictor")
+        return loaded_predictor
 
-        config['cnn']['pretrained'] = True
+    # config from vietocr (uses built-in weights download)
+    config = Cfg.load_config_from_name(config_name)
+
+    config['cnn']['pretrained'] = True
+    # Resolve the weights to a local file here, so callers can see which one is loaded
+    config['weights'] = download_weights(config['weights'])
+    # Run on the same GPU as this device's detector session when there is one
+    gpu_id = device_id if device_id is not None else 0
+    if torch.cuda.is_available() and torch.cuda.device_count() > gpu_id:
+        config['device'] = f"cuda:{gpu_id}"
+    else:
         config['device'] = 'cpu'
-        self.detector = Predictor(config)
+    loaded_predictor = Predictor(config)
+    logging.info(f"load_predictor {predictor_cached_tag} uses {config['device']}")
+    loaded_predictors[predictor_cached_tag] = loaded_predictor
+    return loaded_predictor
+
+
+class TextRecognizer:
+    """High-level wrapper around VietOCR for text recognition only."""
+
+    def __init__(self, model_dir=None, device_id: int | None = None, config_name="vgg_seq2seq"):
+        # 'vgg_seq2seq' is the default; 'vgg_transformer' is slower but available
+        self.detector = load_predictor(config_name, device_id)
+        self.config_name = config_name
+        self.model_files = [self.detector.config['weights']]
 
     def __call__(self, img_list):
-        results = []
-        for img in img_list:
-            # Ensure PIL Image
-            if isinstance(img, np.ndarray):
-                img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            text = self.detector.predict(img)
-            results.append((text, 1.0))
-        return results, 0.0
+        if not img_list:
+            return [], 0.0
+
+        st = time.time()
+        # Ensure PIL Image
+        imgs = [Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)) if isinstance(img, np.ndarray) else img
+                for img in img_list]
+        # predict_batch decodes crops of similar width in one forward pass
+        texts = self.detector.predict_batch(imgs)
+        return [(text, 1.0) for text in texts], time.time() - st
 
 
 class TextDetector:
@@ -179,6 +237,7 @@ class TextDetector:
 
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.run_options = load_model(model_dir, 'det', device_id)
+        self.model_files = [resolve_model_file(model_dir, 'det')]
         self.input_tensor = self.predictor.get_inputs()[0]
 
         img_h, img_w = self.input_tensor.shape[2:]
@@ -237,7 +296,8 @@ class TextDetector:
         return dt_boxes
 
     def __call__(self, img):
-        ori_im = img.copy()
+        # The preprocess ops never write to their input
+        ori_shape = img.shape
         data = {'image': img}
 
         st = time.time()
@@ -247,7 +307,7 @@ class TextDetector:
             return None, 0
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
+        img = np.ascontiguousarray(img)
         input_dict = {}
         input_dict[self.input_tensor.name] = img
         for i in range(100000):
@@ -261,12 +321,15 @@ class TextDetector:
 
         post_result = self.postprocess_op({"maps": outputs[0]}, shape_list)
         dt_boxes = post_result[0]['points']
-        dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+        dt_boxes = self.filter_tag_det_res(dt_boxes, ori_shape)
 
         return dt_boxes, time.time() - st
 
 
 class OCR:
+    # ocr_onnx.OCR swaps in the ONNX VietOCR recognizer here
+    text_recognizer_cls = TextRecognizer
+
     def __init__(self, model_dir=None):
         """
         If you have trouble downloading HuggingFace models, -_^ this might help!!
@@ -292,10 +355,10 @@ class OCR:
                     self.text_recognizer = []
                     for device_id in range(PARALLEL_DEVICES):
                         self.text_detector.append(TextDetector(model_dir, device_id))
-                        self.text_recognizer.append(TextRecognizer(model_dir, device_id))
+                        self.text_recognizer.append(self.text_recognizer_cls(model_dir, device_id))
                 else:
                     self.text_detector = [TextDetector(model_dir, 0)]
-                    self.text_recognizer = [TextRecognizer(model_dir, 0)]
+                    self.text_recognizer = [self.text_recognizer_cls(model_dir, 0)]
 
             except Exception:
                 model_dir = snapshot_download(repo_id="InfiniFlow/deepdoc",
@@ -307,10 +370,10 @@ class OCR:
                     self.text_recognizer = []
                     for device_id in range(PARALLEL_DEVICES):
                         self.text_detector.append(TextDetector(model_dir, device_id))
-                        self.text_recognizer.append(TextRecognizer(model_dir, device_id))
+                        self.text_recognizer.append(self.text_recognizer_cls(model_dir, device_id))
                 else:
                     self.text_detector = [TextDetector(model_dir, 0)]
-                    self.text_recognizer = [TextRecognizer(model_dir, 0)]
+                    self.text_recognizer = [self.text_recognizer_cls(model_dir, 0)]
 
         self.drop_score = 0.5
         self.crop_image_res_index = 0
@@ -417,55 +480,55 @@ class OCR:
             texts.append(text)
         return texts
 
-    def __call__(self, img, device_id=0, cls=True, return_time: bool = False):
+    def __call__(self, img, device_id=0, return_time: bool = False):
         """
         Full OCR pipeline on a single image.
 
         Returns list of (box, (text, score)) and optionally a time_dict
         containing 'det', 'rec', 'cls', and 'all' (total) processing times.
+        The list is empty when there is no image or nothing was detected.
         """
         time_dict = {'det': 0, 'rec': 0, 'cls': 0, 'all': 0}
         if device_id is None:
             device_id = 0
 
         if img is None:
-            return None, None, time_dict
+            return ([], time_dict) if return_time else []
 
         start = time.time()
-        ori_im = img.copy()
         dt_boxes, elapse = self.text_detector[device_id](img)
         time_dict['det'] = elapse
 
         if dt_boxes is None:
-            end = time.time()
-            time_dict['all'] = end - start
-            return None, None, time_dict
-
-        img_crop_list = []
+            time_dict['all'] = time.time() - start
+            return ([], time_dict) if return_time else []
 
         dt_boxes = self.sorted_boxes(dt_boxes)
-
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            img_crop = self.get_rotate_crop_image(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        # get_rotate_crop_image only reads the box, no need to copy it
+        img_crop_list = [self.get_rotate_crop_image(img, box) for box in dt_boxes]
 
         rec_res, elapse = self.text_recognizer[device_id](img_crop_list)
-
         time_dict['rec'] = elapse
 
-        filter_boxes, filter_rec_res = [], []
-        for box, rec_result in zip(dt_boxes, rec_res):
-            text, score = rec_result
-            if score >= self.drop_score:
-                filter_boxes.append(box)
-                filter_rec_res.append(rec_result)
-        end = time.time()
-        time_dict['all'] = end - start
-
-        # for bno in range(len(img_crop_list)):
-        #    print(f"{bno}, {rec_res[bno]}")
-        result = list(zip([a.tolist() for a in filter_boxes], filter_rec_res))
+        result = [(box.tolist(), rec_result) for box, rec_result in zip(dt_boxes, rec_res)
+                  if rec_result[1] >= self.drop_score]
+        time_dict['all'] = time.time() - start
+
         if return_time:
             return result, time_dict
         return result
+
+
+if __name__ == "__main__":
+    # python -m module.ocr quantize det [layout tsr ...]
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=["quantize"])
+    parser.add_argument('models', nargs="+", help="Model names in the model directory, e.g. det layout tsr")
+    parser.add_argument('--model_dir', help="Default: './onnx'",
+                        default=os.path.join(get_project_base_directory(), "onnx"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for nm in args.models:
+        quantize_model(args.model_dir, nm)
@@ -121,11 +121,15 @@ class NormalizeImage:
         img = data['image']
         from PIL import Image
         if isinstance(img, Image.Image):
-            img = np.array(img)
+            img = np.asarray(img)
         assert isinstance(img,
                           np.ndarray), "invalid input 'img' in NormalizeImage"
-        data['image'] = (
-            img.astype('float32') * self.scale - self.mean) / self.std
+        # One float32 buffer, normalized in place
+        img = img.astype('float32')
+        img *= self.scale
+        img -= self.mean
+        img /= self.std
+        data['image'] = img
         return data
 
 
@@ -140,7 +144,7 @@ class ToCHWImage:
         img = data['image']
         from PIL import Image
         if isinstance(img, Image.Image):
-            img = np.array(img)
+            img = np.asarray(img)
         data['image'] = img.transpose((2, 0, 1))
         return data
 
@@ -28,7 +28,7 @@ from .operators import preprocess
 from . import operators
 from .ocr import load_model
 # ONNX
-# from from module.ocr_onnx import OCR
+# from module.ocr_onnx import OCR
 
 class Recognizer:
     def __init__(self, label_list, task_name, model_dir=None):
@@ -52,6 +52,10 @@ class Recognizer:
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
+        # Single-input models exported with a symbolic batch dimension can take a
+        # whole batch of equally sized inputs in one session run
+        self.batchable = len(self.input_names) == 1 and \
+            not isinstance(self.ort_sess.get_inputs()[0].shape[0], int)
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
@@ -304,12 +308,14 @@ class Recognizer:
             hh, ww = self.input_shape
             for img in image_list:
                 h, w = img.shape[:2]
+                # Shrink the uint8 page to the model size first; colour conversion
+                # and the float32 cast then only touch ww*hh pixels
+                img = cv2.resize(img, (ww, hh))
                 img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                img = cv2.resize(np.array(img).astype('float32'), (ww, hh))
+                # Cast the uint8 image to float32 once, directly into NCHW layout
+                img = np.ascontiguousarray(img.transpose(2, 0, 1)[np.newaxis, :, :, :], dtype=np.float32)
                 # Scale input pixel values to 0 to 1
                 img /= 255.0
-                img = img.transpose(2, 0, 1)
-                img = img[np.newaxis, :, :, :].astype(np.float32)
                 inputs.append({self.input_names[0]: img, "scale_factor": [w/ww, h/hh]})
         return inputs
 
@@ -413,7 +419,7 @@ class Recognizer:
         imgs = []
         for i in range(len(image_list)):
             if not isinstance(image_list[i], np.ndarray):
-                imgs.append(np.array(image_list[i]))
+                imgs.append(np.asarray(image_list[i]))
             else:
                 imgs.append(image_list[i])
 
@@ -424,6 +430,12 @@ class Recognizer:
             batch_image_list = imgs[start_index:end_index]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
+            if self.batchable and len(inputs) > 1:
+                feed = {self.input_names[0]: np.concatenate([ins[self.input_names[0]] for ins in inputs], axis=0)}
+                outputs = self.ort_sess.run(None, feed, self.run_options)[0]
+                for j, ins in enumerate(inputs):
+                    res.append(self.postprocess(outputs[j:j + 1], ins, thr))
+                continue
             for ins in inputs:
                 bb = self.postprocess(self.ort_sess.run(None, {k:v for k,v in ins.items() if k in self.input_names}, self.run_options)[0], ins, thr)
                 res.append(bb)
@@ -25,6 +25,27 @@ from utils.file_utils import get_project_base_directory
 from .recognizer import Recognizer
 
 
+# Compiled once at import: blockType/is_caption run for every OCR box of every table
+CAPTION_PATTERNS = [
+    re.compile(r"[图表]+[ 0-9:：]{2,}")
+]
+
+BLOCK_TYPE_PATTERNS = [
+    (re.compile("^(20|19)[0-9]{2}[年/-][0-9]{1,2}[月/-][0-9]{1,2}日*$"), "Dt"),
+    (re.compile(r"^(20|19)[0-9]{2}年$"), "Dt"),
+    (re.compile(r"^(20|19)[0-9]{2}[年-][0-9]{1,2}月*$"), "Dt"),
+    (re.compile("^[0-9]{1,2}[月-][0-9]{1,2}日*$"), "Dt"),
+    (re.compile(r"^第*[一二三四1-4]季度$"), "Dt"),
+    (re.compile(r"^(20|19)[0-9]{2}年*[一二三四1-4]季度$"), "Dt"),
+    (re.compile(r"^(20|19)[0-9]{2}[ABCDE]$"), "Dt"),
+    (re.compile("^[0-9.,+%/ -]+$"), "Nu"),
+    (re.compile(r"^[0-9A-Z/\._~-]+$"), "Ca"),
+    (re.compile(r"^[A-Z]*[a-z' -]+$"), "En"),
+    (re.compile(r"^[0-9.,+-]+[0-9A-Za-z/$￥%<>（）()' -]+$"), "NE"),
+    (re.compile(r"^.{1}$"), "Sg")
+]
+
+
 class TableStructureRecognizer(Recognizer):
     labels = [
         "table",
@@ -49,6 +70,7 @@ class TableStructureRecognizer(Recognizer):
         tbls = super().__call__(images, thr)
         res = []
         # align left&right for rows, align top&bottom for columns
+        # res[i] always belongs to images[i], even when nothing was detected
         for tbl in tbls:
             lts = [{"label": b["type"],
                     "score": b["score"],
@@ -56,6 +78,7 @@ class TableStructureRecognizer(Recognizer):
                     "top": b["bbox"][1], "bottom": b["bbox"][-1]
                     } for b in tbl]
             if not lts:
+                res.append(lts)
                 continue
 
             left = [b["x0"] for b in lts if b["label"].find(
@@ -63,6 +86,7 @@ class TableStructureRecognizer(Recognizer):
             right = [b["x1"] for b in lts if b["label"].find(
                 "row") > 0 or b["label"].find("header") > 0]
             if not left:
+                res.append(lts)
                 continue
             left = np.mean(left) if len(left) > 4 else np.min(left)
             right = np.mean(right) if len(right) > 4 else np.max(right)
@@ -92,32 +116,16 @@ class TableStructureRecognizer(Recognizer):
 
     @staticmethod
     def is_caption(bx):
-        patt = [
-            r"[图表]+[ 0-9:：]{2,}"
-        ]
-        if any([re.match(p, bx["text"].strip()) for p in patt]) \
+        if any(p.match(bx["text"].strip()) for p in CAPTION_PATTERNS) \
                 or bx["layout_type"].find("caption") >= 0:
             return True
         return False
 
     @staticmethod
     def blockType(b):
-        patt = [
-            ("^(20|19)[0-9]{2}[年/-][0-9]{1,2}[月/-][0-9]{1,2}日*$", "Dt"),
-            (r"^(20|19)[0-9]{2}年$", "Dt"),
-            (r"^(20|19)[0-9]{2}[年-][0-9]{1,2}月*$", "Dt"),
-            ("^[0-9]{1,2}[月-][0-9]{1,2}日*$", "Dt"),
-            (r"^第*[一二三四1-4]季度$", "Dt"),
-            (r"^(20|19)[0-9]{2}年*[一二三四1-4]季度$", "Dt"),
-            (r"^(20|19)[0-9]{2}[ABCDE]$", "Dt"),
-            ("^[0-9.,+%/ -]+$", "Nu"),
-            (r"^[0-9A-Z/\._~-]+$", "Ca"),
-            (r"^[A-Z]*[a-z' -]+$", "En"),
-            (r"^[0-9.,+-]+[0-9A-Za-z/$￥%<>（）()' -]+$", "NE"),
-            (r"^.{1}$", "Sg")
-        ]
-        for p, n in patt:
-            if re.search(p, b["text"].strip()):
+        text = b["text"].strip()
+        for p, n in BLOCK_TYPE_PATTERNS:
+            if p.search(text):
                 return n
 
     @staticmethod
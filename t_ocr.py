@@ -14,6 +14,8 @@
 #  limitations under the License.
 #
 
+import hashlib
+import json
 import os
 import sys
 sys.path.insert(
@@ -27,8 +29,8 @@ sys.path.insert(
 from module.seeit import draw_box
 from module.ocr import OCR
 # ONNX
-# from from module.ocr_onnx import OCR
-from module import init_in_out
+# from module.ocr_onnx import OCR
+from module import iter_in_out
 import argparse
 import numpy as np
 import trio
@@ -43,78 +45,145 @@ from PIL import Image
 
 from datetime import datetime
 
-log_dir = "log"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "t_ocr.log")
 
-# Count previous runs by counting lines that start with "=== Run"
-run_count = 1
-if os.path.exists(log_file):
-    with open(log_file, "r", encoding="utf-8") as f:
-        run_count += sum(1 for line in f if line.startswith("=== Run"))
+def init_log():
+    """Append a run header to the log file and redirect stdout/stderr into it.
 
-# Write run header with count and date
-with open(log_file, "a", encoding="utf-8") as f:
-    f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+    Called from __main__ only, so importing this script has no side effects.
+    """
+    log_dir = "log"
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, "t_ocr.log")
 
-sys.stdout = open(log_file, "a", encoding="utf-8")
-sys.stderr = sys.stdout
+    # Count previous runs by counting lines that start with "=== Run"
+    run_count = 1
+    if os.path.exists(log_file):
+        with open(log_file, "r", encoding="utf-8") as f:
+            run_count += sum(1 for line in f if line.startswith("=== Run"))
+
+    # Write run header with count and date
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+
+    sys.stdout = open(log_file, "a", encoding="utf-8")
+    sys.stderr = sys.stdout
 
 
 def main(args):
     import torch.cuda
 
     cuda_devices = torch.cuda.device_count()
-    limiter = [trio.CapacityLimiter(1) for _ in range(cuda_devices)] if cuda_devices > 1 else None
-    ocr = OCR()
-    images, outputs = init_in_out(args)
-
-    def __ocr(i, id, img):
+    ocr = None
+    ocr_cache = {}
+    pages = iter_in_out(args)
+    workers = max(cuda_devices, 1)
+
+    # Opt-in: persist OCR results across runs, so re-running on unchanged pages
+    # skips detection and recognition
+    cache_root = os.environ.get("OCR_RESULT_CACHE_DIR")
+    if cache_root:
+        os.makedirs(cache_root, exist_ok=True)
+
+    model_tag = None
+
+    def __model_tag():
+        """Name the models behind a result: recognizer, its config and the model files actually loaded."""
+        recognizer = ocr.text_recognizer[0]
+        tag = [f"{type(recognizer).__module__}.{type(recognizer).__qualname__}",
+               recognizer.config_name, str(ocr.drop_score)]
+        for path in ocr.text_detector[0].model_files + recognizer.model_files:
+            st = os.stat(path)
+            tag.append(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}")
+        return "|".join(tag)
+
+    def __cache_file(key):
+        if not cache_root:
+            return None
+        tag = f"{key[0]}|{key[1]}|{model_tag}"
+        return os.path.join(cache_root, hashlib.sha1(tag.encode("utf-8")).hexdigest() + ".json")
+
+    def __ocr(i, id, img, output):
         """Run OCR on a single page/image and write image + text outputs."""
         print("Task {} start".format(i))
         start_time = time.time()
-        bxs, time_dict = ocr(np.array(img), id, return_time=True)
-        print(f"AI det={time_dict['det']:.2f}s | rec={time_dict['rec']:.2f}s | all={time_dict['all']:.2f}s")
+        page = np.asarray(img)
+        # Identical pages (blank pages, repeated covers/separators) are OCR'd once.
+        # The shape is part of the key: the same bytes as WxH and HxW are different pages
+        key = (page.shape, hashlib.sha1(page).hexdigest())
+        cache_file = __cache_file(key)
+        if key in ocr_cache:
+            print(f"Task {i} reuses OCR result of an identical page")
+            bxs = ocr_cache[key]
+        elif cache_file and os.path.exists(cache_file):
+            print(f"Task {i} reuses OCR result from {cache_file}")
+            with open(cache_file, "r", encoding="utf-8") as f:
+                bxs = json.load(f)
+            ocr_cache[key] = bxs
+        else:
+            bxs, time_dict = ocr(page, id, return_time=True)
+            print(f"AI det={time_dict['det']:.2f}s | rec={time_dict['rec']:.2f}s | all={time_dict['all']:.2f}s")
+            ocr_cache[key] = bxs
+            if cache_file:
+                # Write-then-rename so a crash never leaves a truncated result;
+                # the tmp name is per device since two workers may hit the same page
+                with open(f"{cache_file}.{id}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(bxs, f, ensure_ascii=False)
+                os.replace(f"{cache_file}.{id}.tmp", cache_file)
         bxs = [(line[0], line[1][0]) for line in bxs]
         bxs = [{
             "text": t,
             "bbox": [b[0][0], b[0][1], b[1][0], b[-1][1]],
             "type": "ocr",
             "score": 1} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]]
-        img = draw_box(images[i], bxs, ["ocr"], 1.)
-        img.save(outputs[i], quality=95)
+        img = draw_box(img, bxs, ["ocr"], 1.)
+        img.save(output, quality=95)
 
         # Plain-text output (one line per detected text box)
         text_lines = [o["text"] for o in bxs]
-        with open(outputs[i] + ".txt", "w+", encoding='utf-8') as f:
+        with open(output + ".txt", "w+", encoding='utf-8') as f:
             f.write("\n".join(text_lines))
 
         # Markdown output: simple bullet list of recognized lines
         md_lines = [f"- {line}" for line in text_lines]
-        with open(outputs[i] + ".md", "w+", encoding='utf-8') as f:
+        with open(output + ".md", "w+", encoding='utf-8') as f:
             f.write("\n".join(md_lines))
 
         end_time = time.time()
         elapsed = end_time - start_time
         print(f"Task {i} done in {elapsed:.2f} seconds")
 
-    async def __ocr_thread(i, id, img, limiter = None):
-        if limiter:
-            async with limiter:
-                print("Task {} use device {}".format(i, id))
-                await trio.to_thread.run_sync(lambda: __ocr(i, id, img))
-        else:
-            __ocr(i, id, img)
+    async def __load_ocr(ocr_loaded):
+        """Load the detector/recognizer models once, off the event loop."""
+        nonlocal ocr, model_tag
+        ocr = await trio.to_thread.run_sync(OCR)
+        if cache_root:
+            model_tag = __model_tag()
+        ocr_loaded.set()
+
+    async def __ocr_worker(id, receive_channel, ocr_loaded):
+        """Run OCR on device `id` for every page pulled from the channel."""
+        await ocr_loaded.wait()
+        async with receive_channel:
+            async for i, img, output in receive_channel:
+                await trio.to_thread.run_sync(__ocr, i, id, img, output)
 
     async def __ocr_launcher():
-        if cuda_devices > 1:
-            async with trio.open_nursery() as nursery:
-                for i, img in enumerate(images):
-                    nursery.start_soon(__ocr_thread, i, i % cuda_devices, img, limiter[i % cuda_devices])
-                    await trio.sleep(0.1)
-        else:
-            for i, img in enumerate(images):
-                await __ocr_thread(i, 0, img)
+        # Pages render on a helper thread while the models load and the device workers run OCR
+        send_channel, receive_channel = trio.open_memory_channel(workers)
+        ocr_loaded = trio.Event()
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(__load_ocr, ocr_loaded)
+            async with receive_channel:
+                for id in range(workers):
+                    nursery.start_soon(__ocr_worker, id, receive_channel.clone(), ocr_loaded)
+            async with send_channel:
+                i = 0
+                while True:
+                    page = await trio.to_thread.run_sync(next, pages, None)
+                    if page is None:
+                        break
+                    await send_channel.send((i, *page))
+                    i += 1
 
     trio.run(__ocr_launcher)
 
@@ -129,4 +198,5 @@ if __name__ == "__main__":
     parser.add_argument('--output_dir', help="Thư mục lưu trữ hình ảnh đầu ra. Mặc định: './ocr_outputs'",
                         default="./ocr_outputs")
     args = parser.parse_args()
+    init_log()
     main(args)
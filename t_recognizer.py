@@ -29,30 +29,36 @@ sys.path.insert(
 from module.seeit import draw_box
 from module.ocr import OCR 
 # ONNX
-# from from module.ocr_onnx import OCR
+# from module.ocr_onnx import OCR
 from module import LayoutRecognizer, TableStructureRecognizer, init_in_out
 import argparse
-import re
 import numpy as np
 
 from datetime import datetime
 
-log_dir = "log"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "t_recognizer.log")
 
-# Count previous runs by counting lines that start with "=== Run"
-run_count = 1
-if os.path.exists(log_file):
-    with open(log_file, "r", encoding="utf-8") as f:
-        run_count += sum(1 for line in f if line.startswith("=== Run"))
+def init_log():
+    """Append a run header to the log file and redirect stdout/stderr into it.
 
-# Write run header with count and date
-with open(log_file, "a", encoding="utf-8") as f:
-    f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+    Called from __main__ only, so importing this script has no side effects.
+    """
+    log_dir = "log"
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, "t_recognizer.log")
+
+    # Count previous runs by counting lines that start with "=== Run"
+    run_count = 1
+    if os.path.exists(log_file):
+        with open(log_file, "r", encoding="utf-8") as f:
+            run_count += sum(1 for line in f if line.startswith("=== Run"))
+
+    # Write run header with count and date
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(f"\n=== Run {run_count} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+
+    sys.stdout = open(log_file, "a", encoding="utf-8")
+    sys.stderr = sys.stdout
 
-sys.stdout = open(log_file, "a", encoding="utf-8")
-sys.stderr = sys.stdout
 
 def main(args):
     images, outputs = init_in_out(args)
@@ -84,7 +90,7 @@ def main(args):
 
 
 def get_table_markdown(img, tb_cpns, ocr):
-    boxes = ocr(np.array(img))
+    boxes = ocr(np.asarray(img))
     boxes = LayoutRecognizer.sort_Y_firstly(
         [{"x0": b[0][0], "x1": b[1][0],
           "top": b[0][1], "text": t[0],
@@ -94,18 +100,20 @@ def get_table_markdown(img, tb_cpns, ocr):
         np.mean([b[-1][1] - b[0][1] for b,_ in boxes]) / 3
     )
 
-    def gather(kwd, fzy=10, ption=0.6):
+    # TSR labels are a fixed vocabulary (TableStructureRecognizer.labels), so
+    # plain string tests select them without going through the regex engine
+    def gather(keep, fzy=10, ption=0.6):
         nonlocal boxes
         eles = LayoutRecognizer.sort_Y_firstly(
-            [r for r in tb_cpns if re.match(kwd, r["label"])], fzy)
+            [r for r in tb_cpns if keep(r["label"])], fzy)
         eles = LayoutRecognizer.layouts_cleanup(boxes, eles, 5, ption)
         return LayoutRecognizer.sort_Y_firstly(eles, 0)
 
-    headers = gather(r".*header$")
-    rows = gather(r".* (row|header)")
-    spans = gather(r".*spanning")
-    clmns = sorted([r for r in tb_cpns if re.match(
-        r"table column$", r["label"])], key=lambda x: x["x0"])
+    headers = gather(lambda lb: lb.endswith("header"))
+    rows = gather(lambda lb: " row" in lb or " header" in lb)
+    spans = gather(lambda lb: "spanning" in lb)
+    clmns = sorted([r for r in tb_cpns if r["label"] == "table column"],
+                   key=lambda x: x["x0"])
     clmns = LayoutRecognizer.layouts_cleanup(boxes, clmns, 5, 0.5)
 
     for b in boxes:
@@ -155,6 +163,7 @@ if __name__ == "__main__":
     parser.add_argument('--mode', help="Chế độ tác vụ: nhận dạng bố cục (layout) hoặc nhận dạng cấu trúc bảng (tsr)", choices=["layout", "tsr"],
                         default="layout")
     args = parser.parse_args()
+    init_log()
     main(args)
 
 